@@ -1,10 +1,30 @@
 import sys
+import math
 import  numpy as np
+import numba as nb
 import matplotlib.pyplot as plt
+from scipy.fft import fft, fftfreq, fftshift
+from scipy.signal import welch
+from scipy.signal.windows import hann
 from astropy.time import Time
-from astropy.timeseries import TimeSeries
-from astropy.timeseries import aggregate_downsample
-import astropy.units as u
+
+
+@nb.njit(parallel=True, fastmath=True, cache=True)
+def amp_and_bin(f, bin_len, nbins):
+    #   Calculate the amplitude of the interleaved I/Q stream and average it
+    #   in bins of bin_len samples in one pass
+    n_samples = f.shape[0] // 2
+    out = np.zeros(nbins, np.float64)
+    for i in nb.prange(nbins):
+        s = 0.
+        c = 0
+        for j in range(i * bin_len, min((i + 1) * bin_len, n_samples)):
+            s += math.sqrt(f[2*j] * f[2*j] + f[2*j+1] * f[2*j+1])
+            c += 1
+        if c > 0:
+            out[i] = s / c
+    return out
+
 
 if __name__ == '__main__':
 
@@ -24,6 +44,9 @@ if __name__ == '__main__':
     plot_psd = True
     # plot_psd = False
 
+    #   Maximum number of time bins in the waterfall plot
+    waterfall_time_bins = 1000
+
     #   Decode date and time
     year = file_name_components[1][0:4]
     month = file_name_components[1][4:6]
@@ -39,8 +62,12 @@ if __name__ == '__main__':
     sampling = float(file_name_components[4])
     print(f'Detected sampling: {sampling}')
 
-    #   Read file
-    f = np.fromfile(open(file_path), dtype=np.float32)
+    #   Read file - memory map it, so that multi-GB captures are paged in
+    #   on demand instead of being loaded into RAM at once
+    f = np.memmap(file_path, dtype=np.float32, mode='r')
+
+    #   Make sure we have complete I/Q pairs
+    f = f[:f.shape[0] // 2 * 2]
 
     #   Number of data points
     n_data_points = int(f.shape[0] * 0.5)
@@ -49,31 +76,18 @@ if __name__ == '__main__':
     start_time = Time(f'{year}-{month}-{day}T{hour}:{minute}:{second}', format='isot')
 
     if plot_raw:
-        #   Calculate amplitude
-        amplitude = np.sqrt(f[0::2]**2 + f[1::2]**2)
-
-        #   Setup lightcurve
-        time_array = np.arange(0, n_data_points)
+        #   Calculate amplitude and bin lightcurve to 1s
+        bin_len = int(sampling)
+        nbins = math.ceil(n_data_points / bin_len)
+        binned_amplitude = amp_and_bin(np.asarray(f), bin_len, nbins)
 
-        time_series = TimeSeries(
-            time=start_time + time_array / sampling * u.s,
-            data={
-                'amplitude': amplitude,
-            }
-        )
-
-        #   Bin lightcurve
-        ts_binned = aggregate_downsample(
-            time_series,
-            time_bin_size=1 * u.s,
-        )
-
-        # print(ts_binned.time_bin_start)
+        #   Bin centers in JD - plain numpy, no astropy objects per bin
+        jd_axis = start_time.jd + (np.arange(nbins) + 0.5) * bin_len / sampling / 86400.
 
         fig = plt.figure(figsize=(10, 10))
         plt.scatter(
-            ts_binned.time_bin_start.jd,
-            np.array(ts_binned['amplitude']),
+            jd_axis,
+            binned_amplitude,
             s=40,
             facecolors=(0.5, 0., 0.5, 0.2),
             edgecolors=(0.5, 0., 0.5, 0.7),
@@ -85,27 +99,136 @@ if __name__ == '__main__':
         plt.close()
 
     if plot_waterfall or plot_magnitude or plot_psd:
-        data = f[0::2] + 1j * f[1::2]
+        #   The file is interleaved float32 I/Q (I0, Q0, I1, Q1, ...), which
+        #   matches the memory layout of complex64 -> zero copy view
+        data = f.view(np.complex64)
 
     if plot_waterfall:
+        #   Same segmentation as plt.specgram: 1024 point segments with
+        #   128 points overlap
+        n_fft = 2**10
+        hop = n_fft - 128
+        #   float32 window keeps the complex64 data in single precision
+        window = hann(n_fft, sym=False).astype(np.float32)
+        psd_scale = np.float32(1. / (sampling * np.sum(window**2)))
+        n_samples = data.shape[0]
+        n_frames = (n_samples - n_fft) // hop + 1
+
+        #   Consecutive spectra are averaged down to waterfall_time_bins
+        t_factor = max(math.ceil(n_frames / waterfall_time_bins), 1)
+        n_time = n_frames // t_factor
+        n_used = n_time * t_factor
+
+        #   Calculate the spectrogram in chunks of ~256 MB (complex64 frames
+        #   and spectra, float32 power temporaries: ~32 bytes per bin)
+        bytes_per_frame = n_fft * 32
+        chunk_frames = max(2**28 // bytes_per_frame // t_factor, 1) * t_factor
+        Sxx = np.empty((n_time, n_fft), dtype=np.float32)
+        for j0 in range(0, n_used, chunk_frames):
+            j1 = min(j0 + chunk_frames, n_used)
+
+            #   Frames are strided views into the data, all of them are
+            #   windowed and transformed in one vectorized FFT
+            frames = np.lib.stride_tricks.sliding_window_view(
+                data[j0 * hop:(j1 - 1) * hop + n_fft],
+                n_fft,
+            )[::hop]
+            spectra = fft(
+                frames * window,
+                axis=-1,
+                workers=-1,
+                overwrite_x=True,
+            )
+            power = spectra.real**2 + spectra.imag**2
+            Sxx[j0 // t_factor:j1 // t_factor] = power.reshape(
+                -1,
+                t_factor,
+                n_fft,
+            ).mean(axis=1)
+        Sxx *= psd_scale
+
+        #   Shift zero frequency to the center, frequency along the y-axis
+        Sxx = fftshift(Sxx, axes=-1).T
+        frequency = fftshift(fftfreq(n_fft, 1. / sampling))
+
+        #   Times of the averaged segment centers
+        times = (
+            (np.arange(n_time) * t_factor + (t_factor - 1) / 2.) * hop
+            + n_fft / 2.
+        ) / sampling
+
+        #   Convert to dB in place, clip empty bins to avoid -inf
+        np.maximum(Sxx, np.float32(1e-10), out=Sxx)
+        np.log10(Sxx, out=Sxx)
+        Sxx *= 10.
+
+        #   imshow extent refers to the pixel edges, not the bin centers
+        dt = t_factor * hop / sampling
+        df = sampling / n_fft
+
         fig = plt.figure(figsize=(10, 10))
-        plt.specgram(data, NFFT=2**10, Fs=sampling)
+        plt.imshow(
+            Sxx,
+            aspect='auto',
+            origin='lower',
+            extent=[
+                times[0] - dt / 2.,
+                times[-1] + dt / 2.,
+                frequency[0] - df / 2.,
+                frequency[-1] + df / 2.,
+            ],
+            interpolation='nearest',
+        )
         plt.xlabel("Time")
         plt.ylabel("Frequency")
         plt.show()
         plt.close()
 
     if plot_magnitude:
+        n_samples = data.shape[0]
+
+        #   Periodic Hann window, built in float32 to avoid a full length
+        #   float64 array
+        window = np.arange(n_samples, dtype=np.float32)
+        window *= np.float32(2. * np.pi / n_samples)
+        np.cos(window, out=window)
+        window *= np.float32(-0.5)
+        window += np.float32(0.5)
+        window_sum = window.sum(dtype=np.float64)
+
+        #   Windowed magnitude spectrum, FFT with all available cores in
+        #   the buffer of the windowed data
+        spectrum = np.multiply(data, window)
+        del window
+        spectrum = fft(spectrum, workers=-1, overwrite_x=True)
+        magnitude = np.abs(spectrum)
+        del spectrum
+        magnitude /= np.float32(window_sum)
+        magnitude = fftshift(magnitude)
+        frequency = fftshift(fftfreq(n_samples, 1. / sampling))
+
         fig = plt.figure(figsize=(10, 10))
-        plt.magnitude_spectrum(data, Fs=sampling)
+        plt.plot(frequency, magnitude)
         plt.xlabel("Frequency")
         plt.ylabel("Magnitude")
         plt.show()
         plt.close()
 
     if plot_psd:
+        #   Welch estimate with the same setup as plt.psd (256 point
+        #   segments, no overlap, no detrending)
+        frequency, psd = welch(
+            data,
+            fs=sampling,
+            window='hann',
+            nperseg=256,
+            noverlap=0,
+            detrend=False,
+            return_onesided=False,
+        )
+
         fig = plt.figure(figsize=(10, 10))
-        plt.psd(data, Fs=sampling)
+        plt.plot(fftshift(frequency), 10. * np.log10(fftshift(psd)))
         plt.xlabel("Frequency")
         plt.ylabel("Power")
         plt.show()
@@ -39,17 +39,14 @@ if __name__ == '__main__':
     sampling = int(file_name_components[4])
     print(f'Detected sampling: {sampling}')
 
-    #   Read file
+    #   Read file - memory map it once, chunks are views that the OS pages
+    #   in on demand
+    f = np.memmap(file_path, dtype=np.float32, mode='r')
     offset = 0
     i = 0
     while True:
-        chunk = np.fromfile(
-            open(file_path), 
-            dtype=np.float32,
-            count=sampling * 2,
-            offset=offset,
-        )
-        offset += 4 * 2 * sampling 
+        chunk = f[offset:offset + 2 * sampling]
+        offset += 2 * sampling
         print(offset)
         print(chunk)
         print(chunk.shape)